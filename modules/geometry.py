@@ -1,9 +1,9 @@
 from enum import Enum, auto
+from fractions import Fraction
 import math
 import numpy as np
 
 from typing import Iterable, Union
-from abc import ABC, abstractmethod
 
 
 class Orientation(Enum):
@@ -13,68 +13,111 @@ class Orientation(Enum):
     BETWEEN = auto()
     BEHIND_TARGET = auto()
 
+# Module-level aliases, which are cheaper to look up than the enum class attributes.
+_LEFT, _RIGHT = Orientation.LEFT, Orientation.RIGHT
+_BEHIND_SOURCE, _BETWEEN, _BEHIND_TARGET = Orientation.BEHIND_SOURCE, Orientation.BETWEEN, Orientation.BEHIND_TARGET
+
+# Relative error bound of the floating point cross product, see Shewchuk's "ccwerrboundA".
+_ORIENTATION_ERROR_BOUND = (3.0 + 16.0 * 2.0**-53) * 2.0**-53
+
 
 class Point:
-    def __init__(self,x,y):
-        #self.x = x
-        #self.y = y
-        self._coords = np.array([x, y])
+    __slots__ = ("x", "y", "_hash")
+
+    def __init__(self, x, y):
+        self.x = float(x)
+        self.y = float(y)
+        self._hash = hash((self.x, self.y))
 
-    @property
-    def x(self):
-        return self._coords[0]
-    
-    @property
-    def y(self):
-        return self._coords[1]
-        
     def __eq__(self, other):
-        return self.x == other.x and self.y == other.y
+        return self is other or (self.x == other.x and self.y == other.y)
     
     def __hash__(self):
-        return hash((self.x, self.y))
+        return self._hash
     
     def __repr__(self):
         return f"Point({self.x}, {self.y})"
     
     def distance(self, other: 'Point') -> float:
-        return math.sqrt((self.x - other.x)**2 + (self.y - other.y)**2)
+        return math.hypot(self.x - other.x, self.y - other.y)
     
     def orientation(self, source: 'Point', target: 'Point') -> Orientation:
-        if source == target:
-            raise ValueError("Line (segment) needs two different points")
-        val = (target.x - source.x) * (self.y - source.y) - (target.y - source.y) * (self.x - source.x)
+        source_x, source_y = source.x, source.y
+        dx, dy = target.x - source_x, target.y - source_y
+        px, py = self.x - source_x, self.y - source_y
+        val = dx * py - dy * px
         if val > 0.0:
-            return Orientation.LEFT
+            return _LEFT
         elif val < 0.0:
-            return Orientation.RIGHT
+            return _RIGHT
         else:
-            if source.x != target.x:
-                param = (self.x - source.x) / (target.x - source.x)
+            # Two equal points always give val == 0.0, so checking for them here suffices.
+            if dx != 0.0:
+                param = px / dx
+            elif dy != 0.0:
+                param = py / dy
             else:
-                param = (self.y - source.y) / (target.y - source.y)
+                raise ValueError("Line (segment) needs two different points")
             if param < 0.0:
-                return Orientation.BEHIND_SOURCE
+                return _BEHIND_SOURCE
             elif param > 1.0:
-                return Orientation.BEHIND_TARGET
+                return _BEHIND_TARGET
             else:
-                return Orientation.BETWEEN
+                return _BETWEEN
+
+    def robust_orientation(self, source: 'Point', target: 'Point') -> Orientation:
+        # Like orientation(), but with exact arithmetic whenever rounding errors could flip the sign.
+        source_x, source_y = source.x, source.y
+        left = (target.x - source_x) * (self.y - source_y)
+        right = (target.y - source_y) * (self.x - source_x)
+        val = left - right
+        if abs(val) <= _ORIENTATION_ERROR_BOUND * (abs(left) + abs(right)):
+            val = (
+                (Fraction(target.x) - Fraction(source_x)) * (Fraction(self.y) - Fraction(source_y))
+                - (Fraction(target.y) - Fraction(source_y)) * (Fraction(self.x) - Fraction(source_x))
+            )
+        if val > 0:
+            return _LEFT
+        elif val < 0:
+            return _RIGHT
+
+        # For collinear points, comparing coordinates directly avoids rounding in the parameter.
+        if source_x != target.x:
+            coord, source_coord, target_coord = self.x, source_x, target.x
+        elif source_y != target.y:
+            coord, source_coord, target_coord = self.y, source_y, target.y
+        else:
+            raise ValueError("Line (segment) needs two different points")
+        if source_coord > target_coord:
+            coord, source_coord, target_coord = -coord, -source_coord, -target_coord
+        if coord < source_coord:
+            return _BEHIND_SOURCE
+        elif coord > target_coord:
+            return _BEHIND_TARGET
+        else:
+            return _BETWEEN
 
 class PointReference(Point):
+    __slots__ = ("_container", "_position")
+
     def __init__(self, container: list[Point], position: int):
         self._container = container
         self._position = position
         
     def get_point(self) -> Point:
         return self._container[self._position]
+
+    def __hash__(self):
+        # Not cached, since the referenced container may change.
+        return hash((self.x, self.y))
     
     @property
     def x(self):
-        return self.get_point().x
+        return self._container[self._position].x
     
     @property
     def y(self):
-        return self.get_point().y
+        return self._container[self._position].y
 
     def get_position(self):
         return self._position
@@ -83,10 +126,59 @@ class PointReference(Point):
         return container is self._container
 
 
+def coordinate_arrays(points: Iterable[Point]) -> tuple[np.ndarray, np.ndarray]:
+    points = list(points)
+    xs = np.fromiter((point.x for point in points), dtype = np.float64, count = len(points))
+    ys = np.fromiter((point.y for point in points), dtype = np.float64, count = len(points))
+    return xs, ys
+
+def cross_products(source: Point, target: Point, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+    # Positive values lie to the left of the line from source to target, negative ones to the right.
+    source_x, source_y = source.x, source.y
+    return (target.x - source_x) * (ys - source_y) - (target.y - source_y) * (xs - source_x)
+
+def orientations(source: Point, target: Point, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+    # Batch version of the LEFT / RIGHT test in Point.orientation(): 1 means left, -1 right and 0 collinear.
+    if source == target:
+        raise ValueError("Line (segment) needs two different points")
+    return np.sign(cross_products(source, target, xs, ys)).astype(np.int8)
+
+
+def monotone_chain(points: Iterable[Point]) -> 'Polygon':
+    # Andrew's variant of Graham Scan, sorting with numpy and scanning plain floats instead of Points.
+    points = list(points)
+    if len(points) <= 2:
+        return Polygon(points)
+
+    xs, ys = coordinate_arrays(points)
+    order = np.lexsort((ys, xs))
+    upper_hull = _monotone_chain_single_scan(xs[order].tolist(), ys[order].tolist(), order.tolist())
+
+    order = order[::-1]
+    lower_hull = _monotone_chain_single_scan(xs[order].tolist(), ys[order].tolist(), order.tolist())
+
+    return Polygon(points[i] for i in upper_hull + lower_hull[1:-1])
+
+def _monotone_chain_single_scan(xs: list[float], ys: list[float], indices: list[int]) -> list[int]:
+    chain: list[int] = []
+    for i, (x, y) in enumerate(zip(xs, ys)):
+        while len(chain) >= 2:
+            j, k = chain[-2], chain[-1]
+            if (xs[k] - xs[j]) * (y - ys[j]) - (ys[k] - ys[j]) * (x - xs[j]) < 0.0:
+                break
+            chain.pop()
+        chain.append(i)
+
+    return [indices[i] for i in chain]
+
+
 class Polygon:
+    __slots__ = ("points", "events", "_events_shared", "_previously_drawn_container")
+
     def __init__(self, points: Iterable[Point] = []):
         self.points: list[Point] = []
         self.events: list[Event] = []
+        self._events_shared = False         # Set if another Polygon uses the same events list.
         self._previously_drawn_container = None
         for point in points:
             self.append(point, draw_container = False)
@@ -100,6 +192,7 @@ class Polygon:
             else:
                 self._previously_drawn_container = point._container
 
+        self._own_events()
         if self.events and isinstance(self.events[-1], PopEvent):           # For GiftWrapping.
             self.events[-1] = SetEvent(-1, point, draw_container)
         else:
@@ -107,9 +200,15 @@ class Polygon:
 
     def pop(self) -> Point:
         point = self.points.pop()
-        self.events.append(PopEvent())
+        self._own_events()
+        self.events.append(_POP_EVENT)
         return point
 
+    def _own_events(self):
+        if self._events_shared:
+            self.events = self.events[:]
+            self._events_shared = False
+
     def animate(self, point: Point):
         self.append(point)
         self.pop()
@@ -121,13 +220,16 @@ class Polygon:
         return len(self.points)
 
     def __getitem__(self, key) -> Union[Point, 'Polygon']:
+        if isinstance(key, int):        # The common case in the hull algorithms.
+            return self.points[key]
         # This implementation is a hack, but it works for Graham Scan.
         if isinstance(key, slice):
             if key.step is not None and key.step != 1:
                 raise ValueError("Polygon doesn't accept slice keys with a step different from 1.")
             result = Polygon()
             result.points = self.points[key]
-            result.events = self.events[:]
+            result.events = self.events         # Copied on write, see _own_events().
+            result._events_shared = self._events_shared = True
             return result
         return self.points[key]
 
@@ -136,6 +238,7 @@ class Polygon:
             # This constraint enables an easy implementation of __add__(). TODO: Can probably be changed now.
             raise ValueError("Polygon only accepts a negative integer as a deletion key.")
         del self.points[key]
+        self._own_events()
         self.events.append(DeleteEvent(key))
 
     def __add__(self, other: 'Polygon'):
@@ -146,12 +249,15 @@ class Polygon:
 
 
 # TODO: Generalise 'background_points'.
-class Event(ABC):
-    @abstractmethod
+class Event:
+    __slots__ = ()
+
     def execute_on(self, points: list[Point], background_points: list[Point]):
-        pass
+        raise NotImplementedError
 
 class AppendEvent(Event):
+    __slots__ = ("point", "draw_container")
+
     def __init__(self, point: Point, draw_container: bool):
         self.point = point
         self.draw_container = draw_container
@@ -162,10 +268,16 @@ class AppendEvent(Event):
             background_points.extend(self.point._container)
 
 class PopEvent(Event):
+    __slots__ = ()
+
     def execute_on(self, points: list[Point], background_points: list[Point]):
         points.pop()
 
+_POP_EVENT = PopEvent()     # Pop events carry no state, so a single instance is shared.
+
 class SetEvent(Event):
+    __slots__ = ("key", "point", "draw_container")
+
     def __init__(self, key, point, draw_container: bool):
         self.key = key
         self.point = point
@@ -177,6 +289,8 @@ class SetEvent(Event):
             background_points.extend(self.point._container)
 
 class DeleteEvent(Event):
+    __slots__ = ("key",)
+
     def __init__(self, key):
         self.key = key
 
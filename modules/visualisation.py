@@ -1,9 +1,13 @@
+from contextlib import contextmanager
 from enum import Enum, auto
-from typing import Callable, Iterable, Optional
-from ipycanvas import MultiCanvas, hold_canvas
+from typing import Callable, Iterable, Iterator, Optional
+from ipycanvas import Canvas, MultiCanvas, hold_canvas
 from ipywidgets import Output, Button, Label, Checkbox, HBox, VBox, IntSlider, Layout, HTML, dlink, Widget, BoundedIntText
+from IPython import get_ipython
 from IPython.display import display, display_html, Image, Markdown
-from geometry import Point, Polygon, AppendEvent
+from geometry import Point, Polygon, AppendEvent, coordinate_arrays, orientations
+import asyncio
+import math
 import time
 import numpy as np
 
@@ -24,11 +28,43 @@ class Layer(Enum):
     _FRONT = 5
 
 
+def _throttle(delay: float) -> Callable[[Callable], Callable]:
+    # Calls the decorated function at most once per 'delay' seconds. Calls in between are coalesced, such that
+    # the last one of a burst is made once the delay has passed. This requires a running asyncio event loop.
+    def decorator(function: Callable) -> Callable:
+        previous_call_time = -math.inf
+        pending_args = None
+        pending_handle = None
+
+        def call_pending():
+            nonlocal previous_call_time, pending_handle
+            pending_handle = None
+            previous_call_time = time.monotonic()
+            function(*pending_args)
+
+        def throttled_function(*args):
+            nonlocal previous_call_time, pending_args, pending_handle
+            remaining_time = delay - (time.monotonic() - previous_call_time)
+            if remaining_time <= 0 and pending_handle is None:
+                previous_call_time = time.monotonic()
+                function(*args)
+            else:
+                pending_args = args
+                if pending_handle is None:
+                    pending_handle = asyncio.get_event_loop().call_later(max(remaining_time, 0), call_pending)
+
+        return throttled_function
+    return decorator
+
+
 class Visualisation:
     ## Constants.
 
+    _MAX_POINT_NUMBER = 999
     _DEFAULT_POINT_RADIUS = 5
+    _MAX_ANIMATION_FRAMES = 250
     _DEFAULT_VBOX_ITEM_MARGIN = "0px 0px 20px 0px"
+    _CLICK_THROTTLE_DELAY = 0.1
 
 
     ## Initialisation methods.
@@ -38,11 +74,14 @@ class Visualisation:
         self._height = height
 
         self._points = set()
+        self._ordered_points: list[Point] = []                              # The same points in insertion order.
+        self._point_coordinates = np.empty((self._MAX_POINT_NUMBER, 2))     # Their coordinates in the same order.
         self._canvas_output = Output(layout = Layout(border = "1px solid black"))
 
-        self._previous_callback_finish_time = time.time()
+        self._animation_task: Optional[asyncio.Task] = None
+        @_throttle(self._CLICK_THROTTLE_DELAY)
         def handle_click_on_canvas(x, y):
-            if time.time() - self._previous_callback_finish_time < 1:       # TODO: This doesn't work well...
+            if self._is_animating:
                 return
             if self.add_point(Point(x, self._height - y)):
                 self.clear_algorithm_layers()
@@ -81,6 +120,13 @@ class Visualisation:
             canvas[value].scale(1, -1)
 
         self._canvas = canvas
+        # Layer canvases, resolved once for the drawing methods.
+        self._algo_back_canvas = canvas[Layer._ALGO_BACK.value]
+        self._pts_main_canvas = canvas[Layer._PTS_MAIN.value]
+        self._algo_main_canvas = canvas[Layer._ALGO_MAIN.value]
+        self._pts_fore_canvas = canvas[Layer._PTS_FORE.value]
+        self._algo_fore_canvas = canvas[Layer._ALGO_FORE.value]
+        self._front_canvas = canvas[Layer._FRONT.value]
         self.draw_points(self._points)
 
         self._canvas_output.clear_output(wait = True)
@@ -89,6 +135,8 @@ class Visualisation:
 
     def _init_ui(self):
         self._point_number_label = Label()
+        self._displayed_point_number = None
+        self._point_number_label_deferred = False
         self._update_point_number_label()
 
         self._clear_canvas_button = self._create_button("Clear canvas", self.clear)
@@ -96,17 +144,16 @@ class Visualisation:
         self._random_button_int_text = BoundedIntText(
             value = 250,
             min = 1,
-            max = 999,
+            max = self._MAX_POINT_NUMBER,
             layout = Layout(width = "55px")
         )
-        def get_random_value(maximum: int) -> int:
-            return np.clip(np.random.normal(0.5 * maximum, 0.15 * maximum), 0, maximum)
+        self._rng = np.random.default_rng()
         def random_button_callback():
-            self.clear()
-            self.add_points([
-                Point(get_random_value(self._width), get_random_value(self._height))
-                for _ in range(self._random_button_int_text.value)
-            ])
+            with self._deferred_point_number_label():
+                self.clear()
+                size = np.array([self._width, self._height])
+                coordinates = self._rng.normal(0.5 * size, 0.15 * size, (self._random_button_int_text.value, 2))
+                self.add_points(Point(x, y) for x, y in coordinates.clip(0, size).tolist())
         self._random_button = self._create_button(
             "Random",
             random_button_callback,
@@ -118,6 +165,14 @@ class Visualisation:
         self._instance_buttons = []
         self._algorithm_buttons = []
         self._runtime_labels = []
+        self._runtime_labels_dirty = False
+
+        # Built once and extended by the register methods, instead of being rebuilt on every button click.
+        self._activatable_widgets: list[Widget] = [
+            self._clear_canvas_button,
+            self._random_button_int_text, self._random_button,
+            self._animation_checkbox, self._animation_speed_slider
+        ]
 
     def _init_animation_ui(self):
         self._animation_checkbox = Checkbox(
@@ -131,6 +186,7 @@ class Visualisation:
             min = 1,
             max = 10,
             description = "Speed",
+            continuous_update = False       # The value is only read when an animation starts.
         )
         self._slider_visibility_link = dlink(
             (self._animation_checkbox, "value"),
@@ -143,15 +199,6 @@ class Visualisation:
             transform = lambda disabled: "1px solid lightgrey" if disabled else "1px solid black"
         )
 
-    @property
-    def _activatable_widgets(self) -> Iterable[Widget]:
-        return (
-            self._clear_canvas_button,
-            self._random_button_int_text, self._random_button,
-            *self._instance_buttons, *self._algorithm_buttons,
-            self._animation_checkbox, self._animation_speed_slider
-        )
-
 
     ## Widget display and manipulation methods.
 
@@ -190,27 +237,62 @@ class Visualisation:
 
     # TODO: Respect drawing modes.
     def add_point(self, point: Point, radius: int = _DEFAULT_POINT_RADIUS) -> bool:
-        if len(self._points) >= 999 or point in self._points:
+        if len(self._points) >= self._MAX_POINT_NUMBER or point in self._points:
             return False
-        self._points.add(point)
+        self._store_point(point)
         self.draw_point(point, radius = radius, layer = Layer._PTS_MAIN)
         self._update_point_number_label()
         return True
 
     # TODO: Respect drawing modes.
     def add_points(self, points: Iterable[Point], radius: int = _DEFAULT_POINT_RADIUS):
-        with hold_canvas(self._canvas[Layer._PTS_MAIN.value]):
-            for point in points:
-                if len(self._points) >= 999:
-                    break
-                if point in self._points:
-                    continue
-                self._points.add(point)
-                self.draw_point(point, radius = radius, layer = Layer._PTS_MAIN)
+        previous_point_number = len(self._points)
+        new_points = [point for point in dict.fromkeys(points) if point not in self._points]
+        new_points = new_points[:self._MAX_POINT_NUMBER - previous_point_number]
+
+        if new_points:
+            new_coordinates = self._point_coordinates[previous_point_number:previous_point_number + len(new_points)]
+            new_coordinates[:] = [(point.x, point.y) for point in new_points]
+            self._points.update(new_points)
+            self._ordered_points.extend(new_points)
+            self._pts_main_canvas.fill_circles(new_coordinates[:, 0], new_coordinates[:, 1], radius)
         self._update_point_number_label()
 
+    def _store_point(self, point: Point):
+        self._point_coordinates[len(self._points)] = (point.x, point.y)
+        self._points.add(point)
+        self._ordered_points.append(point)
+
+    @property
+    def _point_coordinate_view(self) -> np.ndarray:
+        return self._point_coordinates[:len(self._points)]
+
+    @property
+    def point_coordinates(self) -> np.ndarray:
+        # Read-only (n, 2) snapshot of the current points in insertion order, e.g. for numpy based algorithms.
+        # It is a copy, since the underlying buffer is reused once points are cleared or replaced.
+        coordinates = self._point_coordinate_view.copy()
+        coordinates.flags.writeable = False
+        return coordinates
+
     def _update_point_number_label(self):
-        self._point_number_label.value = f"Number of points: {len(self._points):0>3}"
+        if self._point_number_label_deferred:
+            return
+        point_number = len(self._points)
+        if point_number == self._displayed_point_number:
+            return
+        self._displayed_point_number = point_number
+        self._point_number_label.value = f"Number of points: {point_number:0>3}"
+
+    @contextmanager
+    def _deferred_point_number_label(self) -> Iterator[None]:
+        # Coalesces all label updates within the block into a single one at its end, e.g. for clearing and refilling.
+        self._point_number_label_deferred = True
+        try:
+            yield
+        finally:
+            self._point_number_label_deferred = False
+            self._update_point_number_label()
 
     def clear(self):
         self.clear_point_layers()
@@ -218,50 +300,104 @@ class Visualisation:
         self._clear_runtime_labels()
 
     def clear_algorithm_layers(self):
-        self._canvas[Layer._ALGO_BACK.value].clear()
-        self._canvas[Layer._ALGO_MAIN.value].clear()
-        self._canvas[Layer._ALGO_FORE.value].clear()
-        self._canvas[Layer._PTS_FORE.value].clear()
-        self._canvas[Layer._FRONT.value].clear()
+        self._algo_back_canvas.clear()
+        self._algo_main_canvas.clear()
+        self._algo_fore_canvas.clear()
+        self._pts_fore_canvas.clear()
+        self._front_canvas.clear()
 
     def clear_point_layers(self):
         self._points.clear()
-        self._canvas[Layer._PTS_MAIN.value].clear()
-        self._canvas[Layer._PTS_FORE.value].clear()
+        self._ordered_points.clear()
+        self._pts_main_canvas.clear()
+        self._pts_fore_canvas.clear()
         self._update_point_number_label()
 
     def _clear_runtime_labels(self):
+        if not self._runtime_labels_dirty:      # Avoids syncing unchanged label values.
+            return
         for label in self._runtime_labels:
             label.value = ""
+        self._runtime_labels_dirty = False
 
     def register_instance(self, name: str, points: Iterable[Point]):
+        points = tuple(dict.fromkeys(points))       # Materialised and de-duplicated once, not on every click.
         def instance_callback():
-            self.clear()
-            self.add_points(points)
-        self._instance_buttons.append(self._create_button(name, instance_callback))
+            with self._deferred_point_number_label():
+                self.clear()
+                self.add_points(points)
+        button = self._create_button(name, instance_callback)
+        self._instance_buttons.append(button)
+        self._activatable_widgets.append(button)
 
     # TODO: Respect drawing modes.
-    def register_algorithm(self, name: str, algorithm: Callable):
+    def register_algorithm(self, name: str, algorithm: Callable, prefilter: bool = False):
         label_index = len(self._runtime_labels)
         self._runtime_labels.append(Label(layout = Layout(margin = self._DEFAULT_VBOX_ITEM_MARGIN)))
         def algorithm_callback():
             self.clear_algorithm_layers()
-            start_time = time.time()
-            result = algorithm(self._points)
-            end_time = time.time()
-            self.draw_polygon(result, animate = self._animation_checkbox.value)
-            self._runtime_labels[label_index].value = f"{1000 * (end_time - start_time):.3f} ms"
-        self._algorithm_buttons.append(self._create_button(name, algorithm_callback))
+            start_time = time.perf_counter_ns()
+            result = algorithm(self._akl_toussaint_points() if prefilter else self._points)
+            end_time = time.perf_counter_ns()
+            self._runtime_labels[label_index].value = f"{(end_time - start_time) / 1e6:.3f} ms"
+            self._runtime_labels_dirty = True
+            return self.draw_polygon(result, animate = self._animation_checkbox.value)
+        button = self._create_button(name, algorithm_callback)
+        self._algorithm_buttons.append(button)
+        self._activatable_widgets.append(button)
+
+    def _akl_toussaint_points(self) -> set[Point]:
+        # Discard all points lying strictly inside the octagon of extreme points in eight directions.
+        coordinates = self._point_coordinate_view
+        if len(coordinates) < 3:
+            return self._points
+        xs, ys = coordinates[:, 0], coordinates[:, 1]
+        extreme_indexes = (
+            np.argmin(xs), np.argmin(xs + ys), np.argmin(ys), np.argmax(xs - ys),
+            np.argmax(xs), np.argmax(xs + ys), np.argmax(ys), np.argmin(xs - ys)
+        )
+
+        octagon: list[Point] = []
+        for index in extreme_indexes:
+            vertex = Point(*coordinates[index])
+            if not octagon or vertex != octagon[-1]:
+                octagon.append(vertex)
+        if octagon[0] == octagon[-1]:
+            octagon.pop()
+        if len(octagon) < 3:
+            return self._points
+
+        inside = np.ones(len(coordinates), dtype = bool)
+        for source, target in zip(octagon, octagon[1:] + octagon[:1]):
+            inside &= orientations(source, target, xs, ys) > 0
+        ordered_points = self._ordered_points
+        return {ordered_points[i] for i in np.flatnonzero(~inside).tolist()}
 
     def _create_button(self, description: str, callback: Callable, layout: Optional[Layout] = None) -> Button:
         if layout is None:
             layout = Layout(margin = self._DEFAULT_VBOX_ITEM_MARGIN)
         button = Button(description = description, layout = layout)
+        def finish_callback():
+            self._enable_widgets()
+        def finish_task(task: asyncio.Task):
+            finish_callback()
+            try:
+                task.result()
+            except asyncio.CancelledError:
+                pass
+            except Exception:
+                # Without this, errors in a task would only be stored on it instead of showing up in the notebook.
+                ipython = get_ipython()
+                if ipython is None:
+                    raise
+                ipython.showtraceback()
         def button_callback(_: Button):
             self._disable_widgets()
-            callback()
-            self._enable_widgets()
-            self._previous_callback_finish_time = time.time()
+            task = callback()
+            if task is None:
+                finish_callback()
+            else:
+                task.add_done_callback(finish_task)
         button.on_click(button_callback)
         return button
 
@@ -282,70 +418,100 @@ class Visualisation:
 
     # TODO: Respect drawing modes.
     def draw_points(self, points: Iterable[Point], radius: int = _DEFAULT_POINT_RADIUS, layer: Layer = Layer._PTS_MAIN):
-        with hold_canvas(self._canvas[layer.value]):
-            for point in points:
-                self.draw_point(point, radius = radius, layer = layer)
+        xs, ys = coordinate_arrays(points)
+        if len(xs) > 0:
+            self._canvas[layer.value].fill_circles(xs, ys, radius)
 
     # TODO: Respect drawing modes. Generalise 'background_points' and foreground drawings. Maybe make layer(s) selectable.
-    def draw_polygon(self, polygon: Polygon, animate = False):
+    def draw_polygon(self, polygon: Polygon, animate = False) -> Optional[asyncio.Task]:
+        # An animation runs as a task on the kernel's event loop, which is returned so callers can wait for it.
         if animate:
-            if polygon.points:
-                polygon.append(polygon.points[0])
-
-            current_points = []
-            background_points = []
-            step_time = 1.1 - 0.1 * self._animation_speed_slider.value
+            self._animation_task = asyncio.ensure_future(self._animate_polygon(polygon))
+            return self._animation_task
+        self._draw_final_polygon(polygon)
+        return None
 
-            for event in polygon.events:
-                if isinstance(event, AppendEvent) and current_points and event.point == current_points[-1]:
+    @property
+    def _is_animating(self) -> bool:
+        return self._animation_task is not None and not self._animation_task.done()
+
+    async def _animate_polygon(self, polygon: Polygon):
+        try:
+            await self._play_polygon_events(polygon)
+        finally:
+            # Also reached if the animation fails or is cancelled, so no half-drawn frame is left behind.
+            self._front_canvas.clear()
+            self._pts_fore_canvas.clear()
+            self._algo_main_canvas.clear()
+        self._draw_final_polygon(polygon)
+
+    async def _play_polygon_events(self, polygon: Polygon):
+        if polygon.points:
+            polygon.append(polygon.points[0])
+
+        current_points = []
+        background_points = []
+        step_time = 1.1 - 0.1 * self._animation_speed_slider.value
+        # Long event sequences are condensed by only drawing every n-th event as a frame.
+        events_per_frame = max(1, math.ceil(len(polygon.events) / self._MAX_ANIMATION_FRAMES))
+        pending_events = 0
+
+        for event in polygon.events:
+            if isinstance(event, AppendEvent) and current_points:
+                last_point = current_points[-1]
+                if event.point is last_point or event.point == last_point:
                     continue
 
-                background_points.clear()
-                event.execute_on(current_points, background_points)
-
-                if background_points:
-                    with hold_canvas(self._canvas[Layer._FRONT.value]):
-                        self._canvas[Layer._FRONT.value].clear()
-                        self._draw_static_path(background_points, Layer._FRONT, close = True)
-                    time.sleep(step_time)
-
-                with hold_canvas(self._canvas[Layer._PTS_FORE.value]), hold_canvas(self._canvas[Layer._ALGO_MAIN.value]):
-                    self._canvas[Layer._PTS_FORE.value].clear()
-                    self._canvas[Layer._ALGO_MAIN.value].clear()
-                    for point in current_points[:-1]:
-                        self.draw_point(point, layer = Layer._PTS_FORE)
-                        self._canvas[Layer._ALGO_MAIN.value].stroke_circle(point.x, point.y, 6)
-                    self.draw_point(current_points[-1], layer = Layer._PTS_FORE)
-                    self.draw_point(current_points[-1], radius = 12, layer = Layer._ALGO_MAIN)
-                    self._draw_static_path(current_points, Layer._ALGO_MAIN)
-                time.sleep(step_time)
-
-            self._canvas[Layer._FRONT.value].clear()
-            self._canvas[Layer._PTS_FORE.value].clear()
-            self._canvas[Layer._ALGO_MAIN.value].clear()
-
-        with hold_canvas(self._canvas[Layer._PTS_FORE.value]), hold_canvas(self._canvas[Layer._ALGO_MAIN.value]), \
-        hold_canvas(self._canvas[Layer._ALGO_BACK.value]):
-            for point in polygon.points:
-                self.draw_point(point, layer = Layer._PTS_FORE)
-                self._canvas[Layer._ALGO_MAIN.value].stroke_circle(point.x, point.y, 6)
-            self._draw_static_path(polygon.points, Layer._ALGO_MAIN, close = True)
-            self._draw_static_path(polygon.points, Layer._ALGO_BACK, close = True, stroke = False, fill = True)
-
-
-    def _draw_static_path(self, points: Iterable[Point], layer: Layer, close = False, stroke = True, fill = False):
-        points_iterator = iter(points)
-        first_point = next(points_iterator)
-        self._canvas[layer.value].begin_path()
-        self._canvas[layer.value].move_to(first_point.x, first_point.y)
-        for point in points_iterator:
-            self._canvas[layer.value].line_to(point.x, point.y)
-        if close:
-            self._canvas[layer.value].close_path()
-        if stroke:
-            self._canvas[layer.value].stroke()
+            container_points = []
+            event.execute_on(current_points, container_points)
+            if container_points:
+                background_points = container_points
+
+            pending_events += 1
+            if pending_events < events_per_frame:
+                continue
+            pending_events = 0
+
+            if background_points:
+                with hold_canvas(self._front_canvas):
+                    self._front_canvas.clear()
+                    self._draw_static_path(*coordinate_arrays(background_points), self._front_canvas, close = True)
+                background_points = []
+                await asyncio.sleep(step_time)
+
+            with hold_canvas(self._pts_fore_canvas), hold_canvas(self._algo_main_canvas):
+                self._pts_fore_canvas.clear()
+                self._algo_main_canvas.clear()
+                xs, ys = coordinate_arrays(current_points)
+                self._pts_fore_canvas.fill_circles(xs, ys, self._DEFAULT_POINT_RADIUS)
+                if len(xs) > 1:
+                    self._algo_main_canvas.stroke_circles(xs[:-1], ys[:-1], 6)
+                self._algo_main_canvas.fill_circle(current_points[-1].x, current_points[-1].y, 12)
+                self._draw_static_path(xs, ys, self._algo_main_canvas)
+            await asyncio.sleep(step_time)
+
+    def _draw_final_polygon(self, polygon: Polygon):
+        with hold_canvas(self._pts_fore_canvas), hold_canvas(self._algo_main_canvas), \
+        hold_canvas(self._algo_back_canvas):
+            xs, ys = coordinate_arrays(polygon.points)
+            if len(xs) > 0:
+                self._pts_fore_canvas.fill_circles(xs, ys, self._DEFAULT_POINT_RADIUS)
+                self._algo_main_canvas.stroke_circles(xs, ys, 6)
+            self._draw_static_path(xs, ys, self._algo_main_canvas, close = True)
+            self._draw_static_path(xs, ys, self._algo_back_canvas, close = True, stroke = False, fill = True)
+
+
+    def _draw_static_path(self, xs: np.ndarray, ys: np.ndarray, canvas: Canvas, close = False, stroke = True, fill = False):
+        if len(xs) < 2:     # Such a path isn't visible anyway.
+            return
+        coordinates = np.column_stack((xs, ys))
         if fill:
-            self._canvas[layer.value].fill()
+            canvas.fill_polygon(coordinates)
+        if stroke:
+            if close:
+                canvas.stroke_polygon(coordinates)
+            else:
+                canvas.stroke_lines(coordinates)
 
     # TODO:  Add Path type that can be animated like Polygon.
     """ def draw_path(self, points: Path, layer: Layer, animate = False):